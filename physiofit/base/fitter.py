@@ -3,10 +3,14 @@ PhysioFit software main module
 """
 
 import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from importlib.machinery import PathFinder
 
 import numpy as np
 from pandas import DataFrame
-from scipy.optimize import minimize, differential_evolution
+from scipy.optimize import minimize, differential_evolution, least_squares
 from scipy.stats import chi2
 
 from physiofit.models.base_model import Model
@@ -14,6 +18,59 @@ from physiofit.models.base_model import Model
 logger = logging.getLogger(f"physiofit.{__name__}")
 
 
+def _mc_worker(
+        new_matrix, params, func, sim_func, time_vector, non_opt_params,
+        sd_matrix, bounds, jac=None
+):
+    """
+    Run one Monte Carlo iteration: optimize the parameters on a noisy matrix
+    (least squares) and simulate the corresponding matrix. Defined at module
+    level so that it can be sent to the worker processes.
+
+    :param new_matrix: noisy matrix used as experimental data
+    :param func: model residuals function used for the optimization
+    :param sim_func: model simulation function. If None, the simulation is
+                     left to the caller and None is returned instead of the
+                     simulated matrix
+    :param jac: model Jacobian function (finite differences if None)
+    :return: tuple containing the optimized parameters and simulated matrix
+    """
+
+    opt_res = PhysioFitter._run_optimization(
+        params, func, new_matrix, time_vector, non_opt_params, sd_matrix,
+        bounds, "least_squares", jac=jac
+    )
+    if sim_func is None:
+        return opt_res.x, None
+    sim_matrix = sim_func(opt_res.x, new_matrix, time_vector, non_opt_params)
+    return opt_res.x, sim_matrix
+
+
+def _is_importable(obj):
+    """
+    Check that the module defining the class of obj can be imported by name
+    from a fresh interpreter, which is needed to send it to worker processes
+    started with the spawn method (default on Windows and macOS). This is not
+    the case for models loaded from a file (see IoHandler.read_model) or
+    defined in __main__.
+
+    :param obj: object whose class should be checked
+    :return: True if the module can be imported by name
+    """
+
+    module_name = type(obj).__module__
+    module = sys.modules.get(module_name)
+    spec = getattr(module, "__spec__", None)
+    if spec is None:
+        return False
+    parent_name = module_name.rpartition(".")[0]
+    try:
+        path = sys.modules[parent_name].__path__ if parent_name else None
+        found = PathFinder.find_spec(module_name, path)
+    except (KeyError, AttributeError, ImportError, ValueError):
+        return False
+    return found is not None and found.origin == spec.origin
+
 
 # TODO: add estimate deg function (eq 6) with plot of best fit and measured values
 
@@ -53,6 +110,16 @@ class PhysioFitter:
                 * a dictionary with the data column headers as keys and the associated value as a scalar or list
 
     :type sd: int, float, list, dict or ndarray
+    :param seed: seed used by the differential evolution and to generate the
+                 Monte Carlo noise, for reproducible optimizations and
+                 sensitivity analyses (default=None, in which case fresh
+                 entropy is used)
+    :type seed: int
+    :param workers: number of processes used by the optimization and the
+                    Monte Carlo analysis (default=1, -1 to use all available
+                    cores). Models whose module cannot be imported by name
+                    (e.g. loaded from a file) always run in the main process
+    :type workers: int
     """
 
     def __init__(
@@ -62,7 +129,9 @@ class PhysioFitter:
             mc=True,
             iterations=100,
             sd=None,
-            debug_mode=False
+            debug_mode=False,
+            seed=None,
+            workers=1
     ):
 
         self.data = data
@@ -71,7 +140,12 @@ class PhysioFitter:
         self.iterations = iterations
         self.sd = sd
         self.debug_mode = debug_mode
+        self.seed = seed
+        self.workers = workers
         self.experimental_matrix = self.data.drop("time", axis=1).to_numpy()
+        # Positions of the missing measurements, used to mask the simulated
+        # matrices
+        self._nan_mask = np.isnan(self.experimental_matrix)
 
         self.simulated_matrix = None
         self.simulated_data = None
@@ -82,6 +156,11 @@ class PhysioFitter:
         self.matrices_ci = None
         self.opt_conf_ints = None
         self.khi2_res = None
+        # The noise generator is built once from the seed sequence and reused
+        # for all the noise draws. Each optimization gets its own generator
+        # spawned from the same sequence
+        self._ss = np.random.SeedSequence(seed)
+        self._rng = np.random.default_rng(self._ss)
 
     def verify_attrs(self):
         """Check that attributes are valid"""
@@ -241,25 +320,51 @@ class PhysioFitter:
         self.sd = np.array(sds)
         self._build_sd_matrix()
 
+    def _get_workers(self):
+        """
+        Get the number of processes to use, falling back to the main process
+        when the model cannot be sent to worker processes (see
+        _is_importable).
+        """
+
+        if self.workers != 1 and not _is_importable(self.model):
+            logger.debug(
+                f"{type(self.model).__module__} cannot be imported by worker "
+                f"processes, running in the main process"
+            )
+            return 1
+        return self.workers
+
     def optimize(self):
         """
         Run optimization and build the simulated matrix
-        from the optimized parameters
+        from the optimized parameters. If the optimization has already been
+        run (e.g. with other sds), the previous optimum is used as starting
+        point (warm start).
         """
 
         logger.info("\nRunning optimization...\n")
         bounds = self.model.bounds()
         parameters = [param for param in self.model.parameters_to_estimate.values()]
+        if self.optimize_results is not None \
+                and len(self.optimize_results.x) == len(parameters):
+            # Bounds may have changed since the previous run
+            lower, upper = np.array(bounds, dtype=float).T
+            parameters = np.clip(self.optimize_results.x, lower, upper)
+            logger.debug(f"Warm start from previous optimum: {parameters}")
         logger.debug(f"Simulate function = {self.model.simulate}")
         self.optimize_results = self._run_optimization(
             params=parameters,
-            func=self.model.simulate,
+            func=self.model.cost,
             exp_data_matrix=self.experimental_matrix,
             time_vector=self.model.time_vector,
-            non_opt_params=self.model.fixed_parameters,
+            non_opt_params=self.model.non_opt_params,
             sd_matrix=self.sd,
             bounds=bounds,
-            method="differential_evolution"
+            method="differential_evolution",
+            vectorized=self.model.vectorized,
+            workers=self._get_workers(),
+            seed=np.random.default_rng(self._ss.spawn(1)[0])
         )
         self.parameter_stats = {
             "optimal": self.optimize_results.x
@@ -273,65 +378,172 @@ class PhysioFitter:
             self.optimize_results.x,
             self.experimental_matrix,
             self.model.time_vector,
-            self.model.fixed_parameters
+            self.model.non_opt_params
         )
         logger.debug(f"simulated_matrix:\n{self.simulated_matrix}")
-        nan_sim_mat = np.copy(self.simulated_matrix)
-        nan_sim_mat[np.isnan(self.experimental_matrix)] = np.nan
-        self.simulated_data = DataFrame(
-            data=nan_sim_mat,
+        # The results DataFrame is only built when it is accessed (see
+        # simulated_data)
+        self.simulated_data = None
+        logger.info(
+            f"Final Simulated Data ({', '.join(self.model.name_vector)}): \n"
+            f"{np.where(self._nan_mask, np.nan, self.simulated_matrix)}\n"
+        )
+
+    @property
+    def simulated_data(self):
+        """
+        DataFrame containing the simulated matrix obtained with the optimized
+        parameters (NaN where there is no measurement), indexed by time. It
+        is built on first access after the optimization, so that no pandas
+        object is created in the numerical code paths.
+        """
+
+        if self._simulated_data is None and self.simulated_matrix is not None:
+            self._simulated_data = self._build_result_dataframe()
+        return self._simulated_data
+
+    @simulated_data.setter
+    def simulated_data(self, value):
+        self._simulated_data = value
+
+    def _build_result_dataframe(self):
+        """
+        Build the simulated data DataFrame from the simulated matrix
+
+        :return: pandas DataFrame with the model names as columns and time as
+                 index
+        """
+
+        simulated_data = DataFrame(
+            data=np.where(self._nan_mask, np.nan, self.simulated_matrix),
             index=self.model.time_vector,
             columns=self.model.name_vector
         )
-        self.simulated_data.index.name = "Time"
-        logger.info(f"Final Simulated Data: \n{self.simulated_data}\n")
+        simulated_data.index.name = "Time"
+        return simulated_data
+
+    @staticmethod
+    def _get_observations(exp_data_matrix, sd_matrix):
+        """
+        Get the indices of the measured (non NaN) points of the experimental
+        matrix, along with the corresponding measurements and sds as flat
+        arrays. The NaN pattern does not change during an optimization, so
+        this is done once and reused in every cost calculation.
+
+        :param exp_data_matrix: experimental matrix
+        :param sd_matrix: sd matrix
+        :return: tuple containing the (rows, columns) indices of the measured
+                 points, the measurements and the sds
+        """
+
+        valid_idx = np.nonzero(~np.isnan(exp_data_matrix))
+        return valid_idx, exp_data_matrix[valid_idx], sd_matrix[valid_idx]
 
     @staticmethod
     def _calculate_cost(
             params, func, exp_data_matrix, time_vector, non_opt_params,
-            sd_matrix
+            valid_idx, exp_flat, sd_flat, out=None
     ):
         """
         Calculate the cost (residue) using the square of
-        simulated-experimental over the SDs
+        simulated-experimental over the SDs on the measured points (see
+        _get_observations). The computation is delegated to the model cost
+        function (see Model.cost), which models can override with a fused
+        implementation that never builds the simulated matrix. If params is a
+        (D, S) block of candidates (vectorized differential evolution), the S
+        costs are returned as an array of shape (S,). out is an optional
+        preallocated simulation buffer with the shape of exp_data_matrix.
+        """
+
+        return func(params, exp_data_matrix, time_vector, non_opt_params,
+                    valid_idx, exp_flat, sd_flat, out)
+
+    @staticmethod
+    def _calculate_residuals(
+            params, func, exp_data_matrix, time_vector, non_opt_params,
+            valid_idx, exp_flat, sd_flat, out=None
+    ):
+        """
+        Calculate the vector of weighted residuals
+        (simulated-experimental)/SDs on the measured points, the cost being
+        the sum of their squares. The computation is delegated to the model
+        residuals function (see Model.residuals).
         """
 
-        simulated_matrix = func(params, exp_data_matrix, time_vector,
-                                non_opt_params)
-        cost_val = np.square((simulated_matrix - exp_data_matrix) / sd_matrix)
-        residuum = np.nansum(cost_val)
-        return residuum
+        return func(params, exp_data_matrix, time_vector, non_opt_params,
+                    valid_idx, exp_flat, sd_flat, out)
 
     @staticmethod
     def _run_optimization(
             params: list,
-            func: Model.simulate,
+            func: Model.cost,
             exp_data_matrix: np.ndarray,
             time_vector: np.ndarray,
             non_opt_params: dict,
             sd_matrix: np.ndarray,
             bounds: tuple,
-            method: str
+            method: str,
+            vectorized: bool = False,
+            jac: callable = None,
+            workers: int = 1,
+            seed: np.random.Generator = None
     ):
         """
         Run the optimization on input parameters using the cost function and
         Scipy minimize (L-BFGS-B method that is deterministic and uses the
-        gradient method for optimizing)
+        gradient method for optimizing). When the model supports it
+        (vectorized=True), the differential evolution evaluates the whole
+        population in a single cost call per generation. Otherwise, the
+        population can be evaluated in parallel by setting workers (-1 for
+        all available cores). seed is passed to the differential evolution.
+
+        With the "least_squares" method, func must return the vector of
+        residuals (see Model.residuals) instead of the cost, and Scipy
+        least_squares (trust region reflective) is used. As the cost is a sum
+        of squares, it converges in far fewer function evaluations than
+        L-BFGS-B. If the model provides it (see Model.jacobian), the analytic
+        Jacobian of the residuals is used instead of finite differences.
         """
 
+        # The simulation buffer is allocated once and reused by every cost
+        # evaluation. With several workers, each worker process receives its
+        # own copy along with the other arguments
+        cost_args = (
+            func, exp_data_matrix, time_vector, non_opt_params,
+            *PhysioFitter._get_observations(exp_data_matrix, sd_matrix),
+            np.empty_like(exp_data_matrix, dtype=float)
+        )
         if method == "differential_evolution":
+            # The default population size and tolerance are kept: the lag
+            # models have a cost that is piecewise in t_lag, and smaller
+            # populations or looser tolerances often stop in a worse basin
             optimize_results = differential_evolution(
-                PhysioFitter._calculate_cost, bounds=bounds,
-                args=(
-                func, exp_data_matrix, time_vector, non_opt_params, sd_matrix),
-                polish=True, x0=np.array(params)
+                PhysioFitter._calculate_cost, bounds=bounds, args=cost_args,
+                popsize=15, tol=0.01, polish=True, x0=np.array(params),
+                vectorized=vectorized, updating="deferred",
+                workers=1 if vectorized else workers, seed=seed
             )
         elif method == "L-BFGS-B":
             optimize_results = minimize(
                 PhysioFitter._calculate_cost, x0=np.array(params),
-                args=(
-                func, exp_data_matrix, time_vector, non_opt_params, sd_matrix),
-                method="L-BFGS-B", bounds=bounds, options={'maxcor': 30}
+                args=cost_args, method="L-BFGS-B", bounds=bounds,
+                options={'maxcor': 30}
+            )
+        elif method == "least_squares":
+            if jac is None:
+                jac = "2-point"
+            else:
+                # least_squares calls the Jacobian with the same arguments as
+                # the residuals function, which is the first of them
+                model_jac = jac
+
+                def jac(x, _, *args):
+                    return model_jac(x, *args)
+
+            optimize_results = least_squares(
+                PhysioFitter._calculate_residuals, x0=np.array(params),
+                args=cost_args, method="trf", jac=jac,
+                bounds=tuple(np.array(bounds, dtype=float).T)
             )
         else:
             raise ValueError(f"{method} is not implemented")
@@ -356,36 +568,46 @@ class PhysioFitter:
             f"{self.iterations}\n"
         )
 
-        # Store the optimized results in variable that will be overridden on
-        # every pass
-        opt_res = self.optimize_results
-        opt_params_list = []
-        matrices = []
-
-        for _ in range(self.iterations):
-            new_matrix = self._apply_noise()
-
-            # We optimise the parameters using the noisy matrix as input
-            opt_res = PhysioFitter._run_optimization(
-                opt_res.x, self.model.simulate, new_matrix, self.model.time_vector,
-                self.model.fixed_parameters, self.sd, self.model.bounds(),
-                "L-BFGS-B"
-            )
-
-            # Store the new simulated matrix in list for later use
-            matrices.append(
+        # Generate all the noisy matrices first so that the independent
+        # optimizations can be spread over several processes
+        noisy_matrices = self._apply_noise()
+        worker = partial(
+            _mc_worker,
+            params=self.optimize_results.x,
+            func=self.model.residuals,
+            # Vectorized models simulate all the iterations at once below
+            sim_func=None if self.model.vectorized else self.model.simulate,
+            jac=self.model.jacobian,
+            time_vector=self.model.time_vector,
+            non_opt_params=self.model.non_opt_params,
+            sd_matrix=self.sd,
+            bounds=self.model.bounds()
+        )
+        workers = self._get_workers()
+        if workers == 1:
+            results = list(map(worker, noisy_matrices))
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=None if workers == -1 else workers
+            ) as executor:
+                results = list(executor.map(worker, noisy_matrices))
+        opt_params_list = [res[0] for res in results]
+
+        # Build a 3D array (iterations, T, M) from all the simulated matrices
+        # to get standard deviation on each data point
+        if self.model.vectorized:
+            # One call on the (D, iterations) block of optimized parameters
+            matrices = np.moveaxis(
                 self.model.simulate(
-                    opt_res.x, new_matrix, self.model.time_vector,
-                    self.model.fixed_parameters
-                )
+                    np.column_stack(opt_params_list),
+                    self.experimental_matrix,
+                    self.model.time_vector,
+                    self.model.non_opt_params
+                ),
+                2, 0
             )
-
-            # Store the new optimised parameters in list for later use
-            opt_params_list.append(opt_res.x)
-
-        # Build a 3D array from all the simulated matrices to get standard
-        # deviation on each data point
-        matrices = np.array(matrices)
+        else:
+            matrices = np.array([res[1] for res in results])
         self.matrices_ci = {
             "lower_ci": np.percentile(matrices, 2.5, axis=0),
             "higher_ci": np.percentile(matrices, 97.5, axis=0)
@@ -399,10 +621,12 @@ class PhysioFitter:
             logger.info(f"{key}: {value}")
 
         # Apply nan mask to be coherent with the experimental matrix
-        nan_lower_ci = np.copy(self.matrices_ci['lower_ci'])
-        nan_higher_ci = np.copy(self.matrices_ci['higher_ci'])
-        nan_lower_ci[np.isnan(self.experimental_matrix)] = np.nan
-        nan_higher_ci[np.isnan(self.experimental_matrix)] = np.nan
+        nan_lower_ci = np.where(
+            self._nan_mask, np.nan, self.matrices_ci['lower_ci']
+        )
+        nan_higher_ci = np.where(
+            self._nan_mask, np.nan, self.matrices_ci['higher_ci']
+        )
 
         logger.info(
             f"Simulated matrix lower confidence interval:\n{nan_lower_ci}\n"
@@ -423,34 +647,30 @@ class PhysioFitter:
                  and high CI
         """
 
-        opt_params_means = np.mean(np.array(opt_params_list), 0)
-        opt_params_sds = np.std(np.array(opt_params_list), 0)
-        opt_params_meds = np.median(np.array(opt_params_list), 0)
-        conf_ints = np.column_stack((
-            np.percentile(opt_params_list, 2.5, 0),
-            np.percentile(opt_params_list, 97.5, 0)
-        ))
+        # Convert the list once and get the CI bounds and median in a single
+        # pass
+        opt_params = np.asarray(opt_params_list)
+        quantiles = np.quantile(opt_params, [0.025, 0.5, 0.975], axis=0)
 
         self.parameter_stats.update({
-            "mean": opt_params_means,
-            "sd": opt_params_sds,
-            "median": opt_params_meds,
-            "CI_2.5": conf_ints[:, 0],
-            "CI_97.5": conf_ints[:, 1]
+            "mean": opt_params.mean(0),
+            "sd": opt_params.std(0),
+            "median": quantiles[1],
+            "CI_2.5": quantiles[0],
+            "CI_97.5": quantiles[2]
         })
 
         # self.parameter_stats_df = DataFrame()
 
     def khi2_test(self):
 
-        number_measurements = np.count_nonzero(
-            ~np.isnan(self.experimental_matrix)
-        )
+        number_measurements = np.count_nonzero(~self._nan_mask)
         number_params = len(self.model.parameters_to_estimate)
         dof = number_measurements - number_params
         cost = self._calculate_cost(
-            self.optimize_results.x, self.model.simulate, self.experimental_matrix,
-            self.model.time_vector, self.model.fixed_parameters, self.sd
+            self.optimize_results.x, self.model.cost, self.experimental_matrix,
+            self.model.time_vector, self.model.non_opt_params,
+            *self._get_observations(self.experimental_matrix, self.sd)
         )
         p_val = chi2.cdf(cost, dof)
 
@@ -487,31 +707,19 @@ class PhysioFitter:
                 f"Value: {p_val}\n"
             )
 
-    @staticmethod
-    def _add_noise(vector, sd):
-        """
-        Add random noise to a given array using input standard deviations.
-
-        :param vector: input array on which to apply noise
-        :type vector: class: numpy.ndarray
-        :param sd: standard deviation to apply to the input array
-        :type sd: class: numpy.ndarray
-        :return: noisy ndarray
-        """
-
-        output = np.random.default_rng().normal(
-            loc=vector, scale=sd, size=vector.size
-        )
-        return output
-
     def _apply_noise(self):
         """
         Apply noise to the simulated matrix obtained using optimized
-        parameters. SDs are obtained from the sd matrix
+        parameters. SDs are obtained from the sd matrix. The noise for all the
+        Monte Carlo iterations is drawn in a single call.
+
+        :return: array of shape (iterations, T, M) containing one noisy
+                 matrix per iteration
         """
 
-        new_matrix = np.array([
-            PhysioFitter._add_noise(self.simulated_matrix[idx, :], sd)
-            for idx, sd in enumerate(self.sd)
-        ])
-        return new_matrix
+        new_matrices = self._rng.normal(
+            loc=self.simulated_matrix,
+            scale=self.sd,
+            size=(self.iterations, *self.simulated_matrix.shape)
+        )
+        return new_matrices
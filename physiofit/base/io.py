@@ -34,7 +34,8 @@ class IoHandler:
     """
 
     allowed_keys = {
-        "sd", "model", "iterations", "mc", "debug_mode"
+        "sd", "model", "iterations", "mc", "debug_mode", "seed",
+        "workers"
     }
 
     def __init__(self):
@@ -260,7 +261,9 @@ class IoHandler:
             mc=kwargs["mc"] if "mc" in kwargs else True,
             iterations=kwargs["iterations"] if "iterations" in kwargs else 100,
             sd=kwargs["sd"] if "sd" in kwargs else StandardDevs(),
-            debug_mode=kwargs["debug_mode"] if "debug_mode" in kwargs else False
+            debug_mode=kwargs["debug_mode"] if "debug_mode" in kwargs else False,
+            seed=kwargs["seed"] if "seed" in kwargs else None,
+            workers=kwargs["workers"] if "workers" in kwargs else 1
         )
 
         if "sd" not in kwargs:
@@ -543,7 +546,9 @@ class ConfigParser:
             sds,
             mc,
             iterations,
-            path_to_data=None
+            path_to_data=None,
+            workers=1,
+            seed=None
     ):
 
         self.path_to_data = path_to_data
@@ -551,6 +556,8 @@ class ConfigParser:
         self.sds = StandardDevs(sds)
         self.mc = mc
         self.iterations = iterations
+        self.workers = workers
+        self.seed = seed
 
         if not isinstance(self.mc, bool):
             raise TypeError(
@@ -561,6 +568,14 @@ class ConfigParser:
             raise TypeError(
                 f"Number of iterations must be an integer: Detected input: {self.mc}, type: {type(self.iterations)}"
             )
+        if not isinstance(self.workers, int):
+            raise TypeError(
+                f"Number of processes must be an integer: Detected input: {self.workers}, type: {type(self.workers)}"
+            )
+        if self.seed is not None and not isinstance(self.seed, int):
+            raise TypeError(
+                f"Seed must be an integer: Detected input: {self.seed}, type: {type(self.seed)}"
+            )
 
     @classmethod
     def from_file(cls, yaml_file):
@@ -583,14 +598,18 @@ class ConfigParser:
                 selected_model=data["model"],
                 sds=data["sds"],
                 mc=data["mc"],
-                iterations=data["iterations"]
+                iterations=data["iterations"],
+                workers=data.get("workers", 1),
+                seed=data.get("seed")
             )
         except KeyError:
             return ConfigParser(
                 selected_model=data["model"],
                 sds=data["sds"],
                 mc=data["mc"],
-                iterations=data["iterations"]
+                iterations=data["iterations"],
+                workers=data.get("workers", 1),
+                seed=data.get("seed")
             )
 
     @classmethod
@@ -603,7 +622,9 @@ class ConfigParser:
             "model": self.model,
             "mc": self.mc,
             "iterations": self.iterations,
-            "sd": self.sds
+            "sd": self.sds,
+            "workers": self.workers,
+            "seed": self.seed
         }
 
     def update_model(self, model):
@@ -626,6 +647,8 @@ class ConfigParser:
                 "sds": dict(self.sds),
                 "mc": self.mc,
                 "iterations": self.iterations,
+                "workers": self.workers,
+                "seed": self.seed,
                 "path_to_data": str(self.path_to_data)
             }
             yaml.safe_dump(
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from ast import literal_eval
+from functools import lru_cache
+from inspect import Parameter, signature
 
 import pandas as pd
 import numpy as np
@@ -17,8 +19,31 @@ import numpy as np
 # les paramètres optimisables optimisables et non optimisables
 
 
+@lru_cache(maxsize=None)
+def _accepts_out(simulate) -> bool:
+    """
+    Check whether a simulate function accepts the out buffer argument. Models
+    written before it was introduced only take four arguments.
+    """
+
+    try:
+        parameters = signature(simulate).parameters
+    except (TypeError, ValueError):
+        return False
+    return "out" in parameters or any(
+        param.kind == Parameter.VAR_KEYWORD for param in parameters.values()
+    )
+
+
 class Model(ABC):
 
+    # Models can provide the analytic Jacobian of the residuals (see
+    # residuals) with respect to the parameters to estimate, as a static
+    # method taking the same arguments as residuals and returning an array
+    # of shape (number of measured points, D). When None, the Jacobian is
+    # approximated by finite differences
+    jacobian = None
+
     def __init__(self, data: pd.DataFrame):
         self.data = data
         self.time_vector = self.data.time.to_numpy()
@@ -36,7 +61,10 @@ class Model(ABC):
         self.parameters_to_estimate = None
         self.fixed_parameters = None
         self.bounds = None
-
+        # Models whose simulate function accepts a (D, S) block of parameter
+        # candidates and returns a (T, M, S) array can be evaluated by the
+        # differential evolution in a single call per generation
+        self.vectorized = False
 
     def __repr__(self):
         return f"Selected model: {self.model_name}\n" \
@@ -59,6 +87,16 @@ class Model(ABC):
         else:
             self.__dict__[key] = value
 
+    @property
+    def non_opt_params(self):
+        """
+        Fixed parameters in the form given to simulate, cost and residuals by
+        the fitter. Models can override it to convert the fixed parameters
+        dict into a form that is faster to use, e.g. a dense array.
+        """
+
+        return self.fixed_parameters
+
     @ abstractmethod
     def get_params(self):
         """
@@ -77,10 +115,94 @@ class Model(ABC):
             params_opti: list,
             data_matrix: np.ndarray,
             time_vector: np.ndarray,
-            params_non_opti: dict | list
+            params_non_opti: dict | list,
+            out: np.ndarray | None = None
     ):
         pass
 
+    @classmethod
+    def _simulate(
+            cls, params_opti, data_matrix, time_vector, params_non_opti, out
+    ):
+        """
+        Call simulate, with the out buffer only if it is given and simulate
+        accepts it (see _accepts_out)
+        """
+
+        if out is None or not _accepts_out(cls.simulate):
+            return cls.simulate(
+                params_opti, data_matrix, time_vector, params_non_opti
+            )
+        return cls.simulate(
+            params_opti, data_matrix, time_vector, params_non_opti, out=out
+        )
+
+    @classmethod
+    def cost(
+            cls,
+            params_opti: list | np.ndarray,
+            data_matrix: np.ndarray,
+            time_vector: np.ndarray,
+            params_non_opti: dict | list,
+            valid_idx: tuple,
+            exp_flat: np.ndarray,
+            sd_flat: np.ndarray,
+            out: np.ndarray | None = None
+    ):
+        """
+        Calculate the cost (residue) using the square of
+        simulated-experimental over the SDs. Only the measured points are
+        used: valid_idx contains their (rows, columns) indices in the data
+        matrix, and exp_flat and sd_flat the corresponding measurements and
+        sds. If given, out is used as simulation buffer (see simulate). Models
+        can override this method to compute the cost without building the
+        simulated matrix.
+
+        :return: cost value, or array of shape (S,) if params_opti is a
+                 (D, S) block of candidates
+        """
+
+        # A (D, S) block of candidates needs a (T, M, S) array, which is not
+        # the shape of the buffer
+        if np.ndim(params_opti) != 1:
+            out = None
+        simulated_matrix = cls._simulate(
+            params_opti, data_matrix, time_vector, params_non_opti, out
+        )
+        simulated_flat = simulated_matrix[valid_idx]
+        if simulated_flat.ndim == 2:
+            exp_flat = exp_flat[:, None]
+            sd_flat = sd_flat[:, None]
+        residuum = np.sum(
+            np.square((simulated_flat - exp_flat) / sd_flat), axis=0
+        )
+        return residuum
+
+    @classmethod
+    def residuals(
+            cls,
+            params_opti: list | np.ndarray,
+            data_matrix: np.ndarray,
+            time_vector: np.ndarray,
+            params_non_opti: dict | list,
+            valid_idx: tuple,
+            exp_flat: np.ndarray,
+            sd_flat: np.ndarray,
+            out: np.ndarray | None = None
+    ):
+        """
+        Calculate the vector of weighted residuals
+        (simulated-experimental)/SDs on the measured points (see cost for the
+        arguments). The cost is the sum of their squares.
+
+        :return: flat array of residuals
+        """
+
+        simulated_matrix = cls._simulate(
+            params_opti, data_matrix, time_vector, params_non_opti, out
+        )
+        return (simulated_matrix[valid_idx] - exp_flat) / sd_flat
+
 
 class Bounds(dict):
 
@@ -3,11 +3,203 @@ Module containing the methods used by PhysioFit.
 """
 from __future__ import annotations
 
+from math import exp
+
 import numpy as np
 import pandas as pd
+from numba import njit
 
 from physiofit.models.base_model import Model, Bounds
 
+
+@njit(cache=True, fastmath=True)
+def _simulate_kernel(params, time_vec, deg_vec, out):
+    """
+    Fill out (shape (T, M, S)) with the simulated biomass and metabolite
+    concentrations for each of the S parameter vectors stored as columns of
+    params (shape (D, S)).
+
+    :param params: parameters to estimate, one candidate per column
+    :param time_vec: time points
+    :param deg_vec: degradation constants, in metabolite order
+    :param out: array in which the simulated matrices are written
+    """
+
+    n_time, n_cols, n_cand = out.shape
+    # exp(-k * t) is obtained as exp(-k * tau) * exp(-k * t_lag), the second
+    # factor being computed once per metabolite and candidate
+    exp_k_t_lag = np.empty(n_cols - 1)
+    for s in range(n_cand):
+        x_0 = params[0, s]
+        mu = params[1, s]
+        t_lag = params[2, s]
+        for j in range(n_cols - 1):
+            exp_k_t_lag[j] = exp(-deg_vec[j] * t_lag)
+        for t in range(n_time):
+            tau = time_vec[t] - t_lag
+            # Concentrations stay at their initial values during the lag phase
+            if tau < 0:
+                out[t, 0, s] = x_0
+                for j in range(n_cols - 1):
+                    out[t, j + 1, s] = params[j * 2 + 4, s]
+                continue
+            # Shared by the biomass and all the metabolites
+            exp_mu_tau = exp(mu * tau)
+            out[t, 0, s] = x_0 * exp_mu_tau
+            for j in range(n_cols - 1):
+                q = params[j * 2 + 3, s]
+                m_0 = params[j * 2 + 4, s]
+                k = deg_vec[j]
+                exp_k_tau = exp(-k * tau)
+                out[t, j + 1, s] = q * (x_0 / (mu + k)) * (
+                    exp_mu_tau - exp_k_tau
+                ) + m_0 * exp_k_tau * exp_k_t_lag[j]
+
+
+@njit(cache=True, fastmath=True)
+def _cost_kernel(params, rows, cols, exp_flat, sd_flat, time_vec, deg_vec, out):
+    """
+    Fill out (shape (S,)) with the cost of each of the S parameter vectors
+    stored as columns of params (shape (D, S)). Only the measured points
+    (rows[p], cols[p]) are visited: the simulated values are computed on the
+    fly and directly accumulated.
+
+    :param params: parameters to estimate, one candidate per column
+    :param rows: time indices of the measured points
+    :param cols: column indices of the measured points
+    :param exp_flat: measurements
+    :param sd_flat: sds of the measurements
+    :param time_vec: time points
+    :param deg_vec: degradation constants, in metabolite order
+    :param out: array in which the costs are written
+    """
+
+    # See _simulate_kernel for exp(-k * t_lag)
+    exp_k_t_lag = np.empty(deg_vec.shape[0])
+    for s in range(out.shape[0]):
+        x_0 = params[0, s]
+        mu = params[1, s]
+        t_lag = params[2, s]
+        for j in range(deg_vec.shape[0]):
+            exp_k_t_lag[j] = exp(-deg_vec[j] * t_lag)
+        acc = 0.0
+        last_t = -1
+        exp_mu_tau = 1.0
+        for p in range(exp_flat.shape[0]):
+            t = rows[p]
+            j = cols[p]
+            tau = time_vec[t] - t_lag
+            # The measured points are sorted by time index, so exp(mu * tau)
+            # is only computed once for all the points of a given time
+            if t != last_t:
+                exp_mu_tau = exp(mu * tau)
+                last_t = t
+            if j == 0:
+                pred = x_0 if tau < 0 else x_0 * exp_mu_tau
+            else:
+                m_0 = params[j * 2 + 2, s]
+                if tau < 0:
+                    pred = m_0
+                else:
+                    q = params[j * 2 + 1, s]
+                    k = deg_vec[j - 1]
+                    exp_k_tau = exp(-k * tau)
+                    pred = q * (x_0 / (mu + k)) * (
+                        exp_mu_tau - exp_k_tau
+                    ) + m_0 * exp_k_tau * exp_k_t_lag[j - 1]
+            acc += ((pred - exp_flat[p]) / sd_flat[p]) ** 2
+        out[s] = acc
+
+
+@njit(cache=True, fastmath=True)
+def _jacobian_kernel(params, rows, cols, sd_flat, time_vec, deg_vec, out):
+    """
+    Fill out (shape (number of measured points, D)) with the analytic
+    derivatives of the weighted residuals (sim - exp) / sd with respect to
+    the parameters to estimate, on the measured points (rows[p], cols[p]).
+
+    :param params: parameters to estimate (shape (D,))
+    :param rows: time indices of the measured points
+    :param cols: column indices of the measured points
+    :param sd_flat: sds of the measurements
+    :param time_vec: time points
+    :param deg_vec: degradation constants, in metabolite order
+    :param out: array in which the Jacobian is written
+    """
+
+    x_0 = params[0]
+    mu = params[1]
+    t_lag = params[2]
+    out[:, :] = 0.0
+    # See _simulate_kernel and _cost_kernel for the exponentials caching
+    exp_k_t_lag = np.empty(deg_vec.shape[0])
+    for j in range(deg_vec.shape[0]):
+        exp_k_t_lag[j] = exp(-deg_vec[j] * t_lag)
+    last_t = -1
+    exp_mu_tau = 1.0
+    for p in range(sd_flat.shape[0]):
+        t = rows[p]
+        j = cols[p]
+        w = 1.0 / sd_flat[p]
+        tau = time_vec[t] - t_lag
+        if t != last_t:
+            exp_mu_tau = exp(mu * tau)
+            last_t = t
+        if j == 0:
+            # X(t) = x_0 during the lag phase, x_0 * exp(mu * tau) after
+            if tau < 0:
+                out[p, 0] = w
+                continue
+            out[p, 0] = w * exp_mu_tau
+            out[p, 1] = w * x_0 * tau * exp_mu_tau
+            out[p, 2] = -w * x_0 * mu * exp_mu_tau
+            continue
+        # M(t) = m_0 during the lag phase,
+        # q * x_0 / (mu + k) * (exp(mu * tau) - exp(-k * tau))
+        # + m_0 * exp(-k * t) after
+        if tau < 0:
+            out[p, j * 2 + 2] = w
+            continue
+        q = params[j * 2 + 1]
+        k = deg_vec[j - 1]
+        exp_k_tau = exp(-k * tau)
+        diff = exp_mu_tau - exp_k_tau
+        ratio = x_0 / (mu + k)
+        out[p, 0] = w * q * diff / (mu + k)
+        out[p, 1] = w * q * (ratio * tau * exp_mu_tau - ratio / (mu + k) * diff)
+        out[p, 2] = -w * q * ratio * (mu * exp_mu_tau + k * exp_k_tau)
+        out[p, j * 2 + 1] = w * ratio * diff
+        out[p, j * 2 + 2] = w * exp_k_tau * exp_k_t_lag[j - 1]
+
+
+def _degradation_vector(params_non_opti, data_matrix):
+    """
+    Get the degradation constants as a dense array in metabolite order, which
+    is the layout expected by the kernels. The kernels do not check bounds,
+    so the number of constants is checked here.
+
+    :param params_non_opti: degradation constants in metabolite order (see
+                            ChildModel.deg_array), or fixed parameters dict
+                            whose "Degradation" entries are in that order
+    :param data_matrix: data matrix, whose columns after the first are the
+                        metabolites
+    :return: float array of shape (M - 1,)
+    """
+
+    if isinstance(params_non_opti, dict):
+        deg_vec = np.fromiter(
+            params_non_opti["Degradation"].values(), dtype=float
+        )
+    else:
+        deg_vec = np.asarray(params_non_opti, dtype=float)
+    if deg_vec.shape != (data_matrix.shape[1] - 1,):
+        raise ValueError(
+            f"Expected {data_matrix.shape[1] - 1} degradation constants "
+            f"(one per metabolite), got {deg_vec.size}"
+        )
+    return deg_vec
+
+
 class ChildModel(Model):
 
     def __init__(self, data):
@@ -18,6 +210,21 @@ class ChildModel(Model):
         self.vini = 1
         self.parameters_to_estimate = None
         self.fixed_parameters = None
+        self.vectorized = True
+        # Compile the simulation, cost and Jacobian kernels now rather than
+        # during the first optimization
+        _simulate_kernel(
+            np.ones((5, 1)), np.zeros(1), np.zeros(1), np.empty((1, 2, 1))
+        )
+        _cost_kernel(
+            np.ones((5, 1)), np.zeros(1, dtype=np.intp),
+            np.zeros(1, dtype=np.intp), np.ones(1), np.ones(1), np.zeros(1),
+            np.zeros(1), np.empty(1)
+        )
+        _jacobian_kernel(
+            np.ones(5), np.zeros(1, dtype=np.intp), np.zeros(1, dtype=np.intp),
+            np.ones(1), np.zeros(1), np.zeros(1), np.empty((1, 5))
+        )
 
     def get_params(self):
 
@@ -50,50 +257,124 @@ class ChildModel(Model):
             }
         }
 
+    @property
+    def deg_array(self):
+        """
+        Degradation constants as a dense array aligned with the metabolites,
+        0 for missing metabolites. Can be given instead of the fixed
+        parameters dict to simulate, cost and jacobian, and is what the
+        fitter passes to them (see non_opt_params).
+        """
+
+        degradation = self.fixed_parameters["Degradation"]
+        return np.array(
+            [degradation.get(met, 0.0) for met in self.metabolites],
+            dtype=float
+        )
+
+    @property
+    def non_opt_params(self):
+        return self.deg_array
+
     @staticmethod
     def simulate(
-            params_opti: list,
+            params_opti: list | np.ndarray,
             data_matrix: np.ndarray,
             time_vector: np.ndarray,
-            params_non_opti: dict
+            params_non_opti: dict | np.ndarray,
+            out: np.ndarray = None
     ):
+        # params_opti is either a single parameter vector of shape (D,) or a
+        # block of S candidate vectors of shape (D, S), in which case the
+        # S simulated matrices are stacked along a third axis
+        params_opti = np.ascontiguousarray(params_opti, dtype=float)
+        vectorized = params_opti.ndim == 2
+        if not vectorized:
+            params_opti = params_opti[:, None]
+
         # Get end shape
-        simulated_matrix = np.empty_like(data_matrix)
-
-        # Get initial params
-        x_0 = params_opti[0]
-        mu = params_opti[1]
-        t_lag = params_opti[2]
-
-        # We get indices in time vector where time < t_lag
-        idx = np.nonzero(time_vector < t_lag)
-
-        # Fill at those indices with x_0
-        x_t_lag = np.full((len(idx) - 1,), x_0)
-
-        # The rest of the biomass points are calculated as usual
-        mult_by_time = x_0 * np.exp(mu * (time_vector[len(idx) - 1:] - t_lag))
-        simulated_matrix[:, 0] = np.concatenate((x_t_lag, mult_by_time),
-                                                axis=None)
-        fixed_params = [value for value in params_non_opti["Degradation"].values()]
-
-        for i in range(1, int(len(params_opti) / 2)):
-            q = params_opti[i * 2 + 1]
-            m_0 = params_opti[i * 2 + 2]
-            k = fixed_params[i - 1]
-            m_t_lag = np.full((len(idx) - 1,), m_0)
-            mult_by_time = q * (x_0 / (mu + k)) * (np.exp(
-                mu * (time_vector - t_lag)
-            ) - np.exp(-k * (time_vector - t_lag))) + (m_0 * np.exp(
-                -k * time_vector)
-                                                       )
-            simulated_matrix[:, i] = np.concatenate(
-                (m_t_lag, mult_by_time),
-                axis=None
+        if out is None:
+            simulated_matrix = np.empty(
+                data_matrix.shape + (params_opti.shape[1],)
             )
+        elif not vectorized:
+            simulated_matrix = out[:, :, None]
+        else:
+            simulated_matrix = out
+        fixed_params = _degradation_vector(params_non_opti, data_matrix)
+        _simulate_kernel(
+            params_opti,
+            np.asarray(time_vector, dtype=float),
+            fixed_params,
+            simulated_matrix
+        )
 
+        if not vectorized:
+            return simulated_matrix[:, :, 0]
         return simulated_matrix
 
+    @staticmethod
+    def cost(
+            params_opti: list | np.ndarray,
+            data_matrix: np.ndarray,
+            time_vector: np.ndarray,
+            params_non_opti: dict | np.ndarray,
+            valid_idx: tuple,
+            exp_flat: np.ndarray,
+            sd_flat: np.ndarray,
+            out: np.ndarray = None
+    ):
+        # Fused simulation and cost calculation (see _cost_kernel). No
+        # simulation buffer is needed, out is only accepted for compatibility
+        # with Model.cost
+        params_opti = np.ascontiguousarray(params_opti, dtype=float)
+        vectorized = params_opti.ndim == 2
+        if not vectorized:
+            params_opti = params_opti[:, None]
+
+        cost_val = np.empty(params_opti.shape[1])
+        fixed_params = _degradation_vector(params_non_opti, data_matrix)
+        _cost_kernel(
+            params_opti,
+            valid_idx[0],
+            valid_idx[1],
+            np.asarray(exp_flat, dtype=float),
+            np.asarray(sd_flat, dtype=float),
+            np.asarray(time_vector, dtype=float),
+            fixed_params,
+            cost_val
+        )
+
+        if not vectorized:
+            return cost_val[0]
+        return cost_val
+
+    @staticmethod
+    def jacobian(
+            params_opti: list | np.ndarray,
+            data_matrix: np.ndarray,
+            time_vector: np.ndarray,
+            params_non_opti: dict | np.ndarray,
+            valid_idx: tuple,
+            exp_flat: np.ndarray,
+            sd_flat: np.ndarray,
+            out: np.ndarray = None
+    ):
+        # Analytic Jacobian of the residuals (see _jacobian_kernel). out is
+        # the simulation buffer, which has not the shape of the Jacobian
+        params_opti = np.ascontiguousarray(params_opti, dtype=float)
+        jac = np.empty((len(exp_flat), len(params_opti)))
+        fixed_params = _degradation_vector(params_non_opti, data_matrix)
+        _jacobian_kernel(
+            params_opti,
+            valid_idx[0],
+            valid_idx[1],
+            np.asarray(sd_flat, dtype=float),
+            np.asarray(time_vector, dtype=float),
+            fixed_params,
+            jac
+        )
+        return jac
 
 if __name__ == "__main__":
     model = ChildModel(
@@ -49,39 +49,42 @@ class ChildModel(Model):
             params_opti: list,
             data_matrix: np.ndarray,
             time_vector: np.ndarray,
-            params_non_opti: dict | list
+            params_non_opti: dict | list,
+            out: np.ndarray = None
     ):
         # Get end shape
-        simulated_matrix = np.empty_like(data_matrix)
+        simulated_matrix = np.empty_like(data_matrix) if out is None else out
+        params_opti = np.asarray(params_opti, dtype=float)
         x_0 = params_opti[0]
         mu = params_opti[1]
         t_lag = params_opti[2]
 
-        # We get indices in time vector where time < t_lag
-        idx = np.nonzero(time_vector < t_lag)
+        # Metabolite parameters are laid out as (q, M0) pairs after the
+        # global parameters: strided views give them in column order
+        q = params_opti[3::2]
+        m_0 = params_opti[4::2]
 
-        # Fill at those indices with x_0
-        x_t_lag = np.full((len(idx) - 1,), x_0)
+        # We get the time points where time < t_lag. A boolean mask is used
+        # rather than a split index because the time vector is not
+        # necessarily sorted (it usually mixes biomass and metabolite
+        # sampling times)
+        lag_mask = time_vector < t_lag
+        post_lag = ~lag_mask
 
-        # The rest of the biomass points are calculated as usual
-        mult_by_time = x_0 * np.exp(mu * (time_vector[len(idx) - 1:] - t_lag))
+        # Concentrations stay at their initial values during the lag phase
+        simulated_matrix[lag_mask, 0] = x_0
 
-        # Concatenate both vectors and transfer to X_t column of the
-        # simulated matrix
-        simulated_matrix[:, 0] = np.concatenate(
-            (x_t_lag, mult_by_time),
-            axis=None
-        )
-        exp_mu_t_lag = np.exp(mu * (time_vector - t_lag)) - 1
+        # The rest of the biomass points are calculated as usual. The
+        # exponential is only computed once, on the post-lag time points, and
+        # shared with the metabolites
+        exp_mu_t_lag = np.exp(mu * (time_vector[post_lag] - t_lag))
+        simulated_matrix[post_lag, 0] = x_0 * exp_mu_t_lag
+        exp_mu_t_lag -= 1
 
-        for i in range(1, int(len(params_opti) / 2)):
-            q = params_opti[i * 2 + 1]
-            m_0 = params_opti[i * 2 + 2]
-            m_t_lag = np.full((len(idx) - 1,), m_0)
-            mult_by_time = q * (x_0 / mu) * exp_mu_t_lag + m_0
-            simulated_matrix[:, i] = np.concatenate(
-                (m_t_lag, mult_by_time),
-                axis=None
-            )
+        # All the metabolite columns at once
+        simulated_matrix[lag_mask, 1:] = m_0
+        simulated_matrix[post_lag, 1:] = np.outer(
+            exp_mu_t_lag, q * (x_0 / mu)
+        ) + m_0
 
         return simulated_matrix
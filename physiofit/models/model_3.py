@@ -55,10 +55,11 @@ class ChildModel(Model):
             params_opti: list,
             data_matrix: np.ndarray,
             time_vector: np.ndarray,
-            params_non_opti: dict | list
+            params_non_opti: dict | list,
+            out: np.ndarray = None
     ):
         # Get end shape
-        simulated_matrix = np.empty_like(data_matrix)
+        simulated_matrix = np.empty_like(data_matrix) if out is None else out
 
         # Get initial params
         x_0 = params_opti[0]
@@ -67,13 +68,21 @@ class ChildModel(Model):
         # Get X_0 values
         exp_mu_t = np.exp(mu * time_vector)
         simulated_matrix[:, 0] = x_0 * exp_mu_t
-        fixed_params = [value for value in params_non_opti["Degradation"].values()]
+        fixed_params = np.fromiter(
+            params_non_opti["Degradation"].values(), dtype=float
+        )
+
+        # Metabolites usually share the same degradation constant (0 by
+        # default), so exp(-k * t) is only computed once per distinct k
+        exp_k_t_cache = {}
 
         for i in range(1, int(len(params_opti) / 2)):
             q = params_opti[i * 2]
             m_0 = params_opti[i * 2 + 1]
             k = fixed_params[i - 1]
-            exp_k_t = np.exp(-k * time_vector)
+            if k not in exp_k_t_cache:
+                exp_k_t_cache[k] = np.exp(-k * time_vector)
+            exp_k_t = exp_k_t_cache[k]
             simulated_matrix[:, i] = q * (x_0 / (mu + k)) \
                                      * (exp_mu_t - exp_k_t) \
                                      + m_0 * exp_k_t
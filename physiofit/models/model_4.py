@@ -49,19 +49,23 @@ class ChildModel(Model):
             params_opti: list,
             data_matrix: np.ndarray,
             time_vector: np.ndarray,
-            params_non_opti: dict | list
+            params_non_opti: dict | list,
+            out: np.ndarray = None
     ):
         # Get end shape
-        simulated_matrix = np.empty_like(data_matrix)
+        simulated_matrix = np.empty_like(data_matrix) if out is None else out
+        params_opti = np.asarray(params_opti, dtype=float)
         x_0 = params_opti[0]
         mu = params_opti[1]
+
+        # Metabolite parameters are laid out as (q, M0) pairs after the
+        # global parameters: strided views give them in column order
+        q = params_opti[2::2]
+        m_0 = params_opti[3::2]
+
         exp_mu_t = np.exp(mu * time_vector)
         simulated_matrix[:, 0] = x_0 * exp_mu_t
-        for i in range(1, int(len(params_opti) / 2)):
-            q = params_opti[i * 2]
-            m_0 = params_opti[i * 2 + 1]
-            simulated_matrix[:, i] = q * (x_0 / mu) \
-                                     * (exp_mu_t - 1) \
-                                     + m_0
+        # All the metabolite columns at once
+        simulated_matrix[:, 1:] = np.outer(exp_mu_t - 1, q * (x_0 / mu)) + m_0
 
         return simulated_matrix
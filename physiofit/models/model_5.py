@@ -76,7 +76,8 @@ class ChildModel(Model):
             params_opti: list,
             data_matrix: np.ndarray,
             time_vector: np.ndarray,
-            params_non_opti: dict
+            params_non_opti: dict,
+            out: np.ndarray = None
     ):
 
         # Get parameters
@@ -120,7 +121,10 @@ class ChildModel(Model):
             t_eval = list(time_vector)
         )
 
-        return sol.y.T
+        if out is None:
+            return sol.y.T
+        out[:] = sol.y.T
+        return out
 
 if __name__ == "__main__":
 
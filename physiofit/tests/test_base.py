@@ -1,6 +1,8 @@
 """
 Test the creation and use of the PhysioFitter
 """
+from io import StringIO
+
 import numpy as np
 import pandas as pd
 import pytest
@@ -108,3 +110,335 @@ def test_that_simulated_and_experimental_matrices_are_close(data, sds):
         equal_nan=True
     )
 
+
+def test_vectorized_simulation(data, sds):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model(
+        "Steady-state batch model with lag phase and degradation of metabolites ",
+        data
+    )
+    model.get_params()
+    assert model.vectorized
+    params = np.array(
+        [param for param in model.parameters_to_estimate.values()]
+    )
+    candidates = np.column_stack((params, params * 0.5, params * 2))
+    sim_block = model.simulate(
+        candidates,
+        model.experimental_matrix,
+        model.time_vector,
+        model.fixed_parameters
+    )
+    assert sim_block.shape == model.experimental_matrix.shape + (3,)
+    for idx in range(candidates.shape[1]):
+        assert np.allclose(
+            sim_block[:, :, idx],
+            model.simulate(
+                candidates[:, idx],
+                model.experimental_matrix,
+                model.time_vector,
+                model.fixed_parameters
+            )
+        )
+
+def test_monte_carlo_vectorized_model(data, sds):
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model(
+        "Steady-state batch model with lag phase and degradation of metabolites ",
+        data
+    )
+    model.get_params()
+    fitter = io.initialize_fitter(
+        model.data,
+        model=model,
+        sd=sds,
+        iterations=20,
+        debug_mode=True
+    )
+    fitter.optimize()
+    fitter.monte_carlo_analysis()
+    for key in ["lower_ci", "higher_ci"]:
+        assert fitter.matrices_ci[key].shape == fitter.experimental_matrix.shape
+    assert np.all(
+        fitter.matrices_ci["higher_ci"] >= fitter.matrices_ci["lower_ci"]
+    )
+    assert len(fitter.parameter_stats["mean"]) == len(model.parameters_to_estimate)
+
+def test_monte_carlo_noise_is_reproducible_with_seed(data, sds):
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model("Steady-state batch model with lag phase", data)
+    model.get_params()
+    fitters = []
+    for _ in range(2):
+        fitter = io.initialize_fitter(
+            model.data,
+            model=model,
+            sd=sds,
+            iterations=5,
+            seed=42
+        )
+        fitter.optimize()
+        fitter.monte_carlo_analysis()
+        fitters.append(fitter)
+    assert np.array_equal(
+        fitters[0].simulated_matrix, fitters[1].simulated_matrix
+    )
+    for key in ["lower_ci", "higher_ci"]:
+        assert np.array_equal(
+            fitters[0].matrices_ci[key], fitters[1].matrices_ci[key]
+        )
+    for key, value in fitters[0].parameter_stats.items():
+        assert np.array_equal(value, fitters[1].parameter_stats[key])
+
+def test_optimization_warm_start(data, sds):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model("Steady-state batch model", data)
+    model.get_params()
+    fitter = io.initialize_fitter(
+        model.data,
+        model=model,
+        sd=sds,
+        debug_mode=True
+    )
+    fitter.optimize()
+    first_cost = fitter.optimize_results.fun
+    fitter.optimize()
+    assert fitter.optimize_results.fun <= first_cost * (1 + 1e-6)
+
+
+def test_simulation_with_dense_degradation_array(data, sds):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model(
+        "Steady-state batch model with lag phase and degradation of metabolites ",
+        data
+    )
+    model.get_params()
+    for idx, met in enumerate(model.metabolites):
+        model.fixed_parameters["Degradation"][met] = 0.01 * (idx + 1)
+    assert np.allclose(
+        model.deg_array, 0.01 * np.arange(1, len(model.metabolites) + 1)
+    )
+    params = np.array(
+        [param for param in model.parameters_to_estimate.values()]
+    )
+    assert np.allclose(
+        model.simulate(
+            params,
+            model.experimental_matrix,
+            model.time_vector,
+            model.deg_array
+        ),
+        model.simulate(
+            params,
+            model.experimental_matrix,
+            model.time_vector,
+            model.fixed_parameters
+        )
+    )
+
+
+def test_models_read_from_file_run_in_main_process(data, sds):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.read_model(physiofit.models.model_2.__file__)(data)
+    model.get_params()
+    fitter = io.initialize_fitter(
+        model.data,
+        model=model,
+        sd=sds,
+        iterations=5,
+        workers=2
+    )
+    # The module of the model only exists in this process
+    assert fitter._get_workers() == 1
+    fitter.optimize()
+    fitter.monte_carlo_analysis()
+    assert fitter.matrices_ci["lower_ci"].shape == model.experimental_matrix.shape
+
+    model = io.select_model("Steady-state batch model", data)
+    model.get_params()
+    fitter = io.initialize_fitter(
+        model.data,
+        model=model,
+        sd=sds,
+        workers=2
+    )
+    assert fitter._get_workers() == 2
+
+
+def test_lag_phase_simulation_with_unsorted_time_vector(data):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model("Steady-state batch model with lag phase", data)
+    model.get_params()
+    x_0, mu, t_lag = 0.03, 0.6, 2.0
+    q = np.array([-4.0, 2.5])
+    m_0 = np.array([14.0, 0.01])
+    params = np.array([x_0, mu, t_lag, q[0], m_0[0], q[1], m_0[1]])
+    time_vector = model.time_vector
+    # Biomass and metabolite sampling times are interleaved
+    assert np.any(np.diff(time_vector) < 0)
+    sim_mat = model.simulate(
+        params,
+        model.experimental_matrix,
+        time_vector,
+        model.fixed_parameters
+    )
+    lag = time_vector < t_lag
+    assert lag.any() and (~lag).any()
+    assert np.allclose(sim_mat[lag, 0], x_0)
+    assert np.allclose(sim_mat[lag, 1:], m_0)
+    exp_mu_t = np.exp(mu * (time_vector[~lag] - t_lag))
+    assert np.allclose(sim_mat[~lag, 0], x_0 * exp_mu_t)
+    assert np.allclose(
+        sim_mat[~lag, 1:],
+        q * (x_0 / mu) * (exp_mu_t[:, None] - 1) + m_0
+    )
+
+
+def test_models_without_simulation_buffer_argument(data, sds):
+
+    from physiofit.models.model_4 import ChildModel
+
+    class LegacyModel(ChildModel):
+
+        # Signature documented before the out buffer was introduced
+        @staticmethod
+        def simulate(params_opti, data_matrix, time_vector, params_non_opti):
+            return ChildModel.simulate(
+                params_opti, data_matrix, time_vector, params_non_opti
+            )
+
+    model = LegacyModel(data)
+    model.get_params()
+    fitter = physiofit.base.io.IoHandler().initialize_fitter(
+        model.data,
+        model=model,
+        sd=sds,
+        iterations=5
+    )
+    fitter.optimize()
+    fitter.monte_carlo_analysis()
+    observations = fitter._get_observations(fitter.experimental_matrix, fitter.sd)
+    buffer = np.empty_like(fitter.experimental_matrix)
+    for func in [model.cost, model.residuals]:
+        assert np.allclose(
+            func(
+                fitter.optimize_results.x, fitter.experimental_matrix,
+                model.time_vector, model.fixed_parameters, *observations,
+                buffer
+            ),
+            func(
+                fitter.optimize_results.x, fitter.experimental_matrix,
+                model.time_vector, model.fixed_parameters, *observations
+            )
+        )
+
+
+def test_analytic_jacobian_matches_finite_differences(data, sds):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model(
+        "Steady-state batch model with lag phase and degradation of metabolites ",
+        data
+    )
+    model.get_params()
+    model.fixed_parameters["Degradation"].update(
+        {"Glucose": 0.05, "Acetate": 0.1}
+    )
+    params = np.array([0.03, 0.6, 1.5, -4.0, 14.0, 2.5, 0.01])
+    # Measured points on both sides of the lag phase
+    assert np.any(model.time_vector < params[2])
+    assert np.any(model.time_vector > params[2])
+    fitter = io.initialize_fitter(model.data, model=model, sd=sds)
+    args = (
+        model.experimental_matrix,
+        model.time_vector,
+        model.fixed_parameters,
+        *fitter._get_observations(model.experimental_matrix, fitter.sd)
+    )
+    jac = model.jacobian(params, *args)
+    step = 1e-6 * np.maximum(np.abs(params), 1)
+    num_jac = np.column_stack([
+        (model.residuals(params + np.eye(len(params))[i] * step[i], *args)
+         - model.residuals(params - np.eye(len(params))[i] * step[i], *args))
+        / (2 * step[i])
+        for i in range(len(params))
+    ])
+    assert jac.shape == num_jac.shape
+    assert np.allclose(jac, num_jac, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "model_name",
+    [
+        "Steady-state batch model with lag phase",
+        "Steady-state batch model with lag phase and degradation of metabolites "
+    ]
+)
+def test_lag_models_reach_the_optimum(data, sds, model_name):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model(model_name, data)
+    model.get_params()
+    for seed in range(8):
+        fitter = io.initialize_fitter(
+            model.data,
+            model=model,
+            sd=sds,
+            seed=seed
+        )
+        fitter.optimize()
+        # The no-lag basin has a cost of about 5.75
+        assert fitter.optimize_results.fun < 4.1
+
+
+def test_degradation_constants_must_match_metabolites(data):
+
+    io = physiofit.base.io.IoHandler()
+    model = io.select_model(
+        "Steady-state batch model with lag phase and degradation of metabolites ",
+        data
+    )
+    model.get_params()
+    params = np.array(
+        [param for param in model.parameters_to_estimate.values()]
+    )
+    with pytest.raises(ValueError):
+        model.simulate(
+            params,
+            model.experimental_matrix,
+            model.time_vector,
+            {"Degradation": {"Glucose": 0.0}}
+        )
+    # The fitter gives the constants aligned with the metabolites, whatever
+    # the order of the dict
+    model.fixed_parameters = {"Degradation": {"Acetate": 0.2, "Glucose": 0.1}}
+    assert np.array_equal(model.non_opt_params, [0.1, 0.2])
+    model.fixed_parameters = {"Degradation": {"Glucose": 0.1}}
+    assert np.array_equal(model.non_opt_params, [0.1, 0.0])
+
+
+def test_config_file_fitter_options():
+
+    config = """
+iterations: 100
+mc: true
+model:
+  bounds: null
+  model_name: Steady-state batch model
+  parameters_to_estimate: null
+sds:
+  X: 0.2
+"""
+    config_parser = physiofit.base.io.ConfigParser.from_file(StringIO(config))
+    assert config_parser.get_kwargs()["workers"] == 1
+    assert config_parser.get_kwargs()["seed"] is None
+    config_parser = physiofit.base.io.ConfigParser.from_file(
+        StringIO(config + "workers: 2\nseed: 42\n")
+    )
+    assert config_parser.get_kwargs()["workers"] == 2
+    assert config_parser.get_kwargs()["seed"] == 42
@@ -115,7 +115,9 @@ def run(data, args, logger, experiments):
             mc=io.configparser.mc,
             iterations=io.configparser.iterations,
             sd=io.configparser.sds,
-            debug_mode=args.debug_mode
+            debug_mode=args.debug_mode,
+            workers=io.configparser.workers,
+            seed=io.configparser.seed
         )
         fitter.optimize()
         if fitter.mc:
@@ -22,7 +22,9 @@ class App:
         self.defaults = {
             "iterations" : 100,
             "sd" : StandardDevs(),
-            "mc" : True
+            "mc" : True,
+            "workers" : 1,
+            "seed" : None
         }
         self.select_menu = None
         self.io = None
@@ -148,7 +150,9 @@ class App:
                 selected_model= self.model,
                 sds = self.sd,
                 mc = self.mc,
-                iterations = self.iterations
+                iterations = self.iterations,
+                workers = self.workers,
+                seed = self.seed
             )
 
             full_dataframe = self.io.data.copy()
@@ -174,7 +178,9 @@ class App:
                         mc=kwargs["mc"],
                         iterations=kwargs["iterations"],
                         sd=kwargs["sd"],
-                        debug_mode=kwargs["debug_mode"]
+                        debug_mode=kwargs["debug_mode"],
+                        workers=kwargs["workers"],
+                        seed=kwargs["seed"]
                     )
                     # Do the work
                     fitter.optimize()
@@ -212,7 +218,7 @@ class App:
             [param for param in self.model.parameters_to_estimate.values()],
             self.model.experimental_matrix,
             self.model.time_vector,
-            self.model.fixed_parameters
+            self.model.non_opt_params
         )
 
     def _initialize_opt_menu_widgets(self, file_extension):
@@ -273,6 +279,32 @@ class App:
                 )
                 if self.iterations < 0:
                     st.error("ERROR: Number of Monte-Carlo iterations must be a positive integer")
+                self.workers = st.number_input(
+                    "Number of processes",
+                    value=self.defaults["workers"] if self.config_parser is None
+                    else self.config_parser.workers,
+                    min_value=-1,
+                    step=1,
+                    help="Number of processes used for the optimization and "
+                         "the Monte Carlo analysis (-1 to use all available "
+                         "cores)."
+                )
+                if self.workers == 0:
+                    st.error("ERROR: Number of processes must be a positive integer or -1")
+                seed = self.defaults["seed"] if self.config_parser is None \
+                    else self.config_parser.seed
+                seed = st.text_input(
+                    "Random seed",
+                    value="" if seed is None else str(seed),
+                    help="Seed for the optimization and the Monte Carlo "
+                         "analysis, to get reproducible results. Leave empty "
+                         "to use a different seed for each run."
+                )
+                try:
+                    self.seed = int(seed) if seed.strip() else None
+                except ValueError:
+                    st.error("ERROR: The random seed must be an integer")
+                    raise
                 self.debug_mode = st.checkbox(
                     "Verbose logs",
                     help="Useful in case of trouble. Join it to the "
@@ -480,6 +512,8 @@ class App:
             "mc": self.mc,
             "iterations": self.iterations,
             "debug_mode": self.debug_mode,
+            "workers": self.workers,
+            "seed": self.seed,
         }
         return kwargs
 